@@ -1,29 +1,101 @@
 # Mnemosyne 插件的命令处理函数实现
 # (注意：装饰器已移除，函数接收 self)
 
+import asyncio
+import heapq
 import json
+import os
 import time as time_module
-from datetime import datetime
 from pathlib import Path
 from typing import TYPE_CHECKING
 
 from astrbot.api import logger
 from astrbot.api.event import AstrMessageEvent
 
+from ..memory_manager.vector_db.query_coalescer import MilvusQueryCoalescer
+from . import initialization
 from .constants import MAX_TOTAL_FETCH_RECORDS, PRIMARY_FIELD_NAME
-from .security_utils import safe_build_milvus_expression, validate_session_id
+from .memory_operations import (
+    _get_persona_id,
+    _try_fetch_roaming_history,
+    handle_summary_long_memory,
+)
+from .tools import format_context_to_string
+
+# 可选加速: orjson 的序列化/解析比标准库快数倍，未安装时回退到标准库 json
+try:
+    import orjson
+
+    def _json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+
+    _json_loads = orjson.loads
+except ImportError:
+    orjson = None
+
+    def _json_dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False)
+
+    _json_loads = json.loads
+from .security_utils import build_eq_expr, validate_session_id
 
 if TYPE_CHECKING:
     from ..main import Mnemosyne
 
 
+def _clip_content(content: str, max_chars: int = 200) -> str:
+    """截断过长的记录内容用于展示，超长时附加省略号。"""
+    if len(content) > max_chars:
+        return content[:max_chars] + "..."
+    return content
+
+
+def _clip_contents(contents: list[str], max_chars: int = 200) -> list[str]:
+    """批量截断记录内容（供批量展示/导出路径复用）。"""
+    return [_clip_content(content, max_chars) for content in contents]
+
+
+def _format_record_line(index: int, record: dict) -> str:
+    """将单条记忆记录格式化为展示文本（展示与导出路径共用）。"""
+    ts = record.get("create_time")
+    try:
+        # 根据 Milvus 文档，Query 结果中的 time 是 float 类型的 Unix 时间戳（秒）。
+        # time.strftime + localtime 比构造 datetime 对象再 strftime 更省时省内存
+        time_str = (
+            time_module.strftime("%Y-%m-%d %H:%M:%S", time_module.localtime(ts))
+            if ts is not None  # 检查 ts 是否存在且不是 None
+            else "未知时间"
+        )
+    except (TypeError, ValueError, OSError) as time_e:
+        # 处理无效或无法解析的时间戳
+        logger.warning(
+            f"记录 {record.get(PRIMARY_FIELD_NAME, '未知ID')} 的时间戳 '{ts}' 无效或解析错误: {time_e}"
+        )
+        time_str = f"无效时间戳({ts})" if ts is not None else "未知时间"
+
+    content = record.get("content", "内容不可用")
+    # 截断过长的内容以优化显示
+    content_preview = _clip_content(content)
+    record_session_id = record.get("session_id", "未知会话")
+    persona_id = record.get("personality_id", "未知人格")
+    pk = record.get(PRIMARY_FIELD_NAME, "未知ID")  # 获取主键
+
+    return (
+        f"#{index} [ID: {pk}]\n"  # 使用从 1 开始的序号
+        f"  时间: {time_str}\n"
+        f"  人格: {persona_id}\n"
+        f"  会话: {record_session_id}\n"
+        f"  内容: {content_preview}"
+    )
+
+
 async def list_collections_cmd_impl(self: "Mnemosyne", event: AstrMessageEvent):
     """[实现] 列出当前 Milvus 实例中的所有集合"""
     if not self.milvus_manager or not self.milvus_manager.is_connected():
         yield event.plain_result("⚠️ Milvus 服务未初始化或未连接。")
         return
     try:
-        collections = self.milvus_manager.list_collections()
+        collections = await asyncio.to_thread(self.milvus_manager.list_collections)
         if collections is None:
             yield event.plain_result("⚠️ 获取集合列表失败，请检查日志。")
             return
@@ -79,7 +151,9 @@ async def delete_collection_cmd_impl(
                 f"管理员 {sender_id} 正在删除当前插件使用的集合 '{collection_name}'！"
             )
 
-        success = self.milvus_manager.drop_collection(collection_name)
+        success = await asyncio.to_thread(
+            self.milvus_manager.drop_collection, collection_name
+        )
         if success:
             msg = f"✅ 已成功删除 Milvus 集合 '{collection_name}'。"
             if is_current_collection:
@@ -139,7 +213,9 @@ async def list_records_cmd_impl(
         return
 
     try:
-        if not self.milvus_manager.has_collection(target_collection):
+        if not await asyncio.to_thread(
+            self.milvus_manager.has_collection, target_collection
+        ):
             yield event.plain_result(f"⚠️ 集合 '{target_collection}' 不存在。")
             return
 
@@ -153,7 +229,7 @@ async def list_records_cmd_impl(
 
             # 如果有会话ID，则按会话ID过滤（使用安全的表达式构建）
             try:
-                expr = safe_build_milvus_expression("session_id", session_id, "==")
+                expr = build_eq_expr("session_id", session_id)
             except ValueError as e:
                 yield event.plain_result(f"⚠️ 构建查询表达式失败: {e}")
                 logger.error(f"构建查询表达式时出错: {e}")
@@ -163,12 +239,13 @@ async def list_records_cmd_impl(
                 f"将按会话 ID '{session_id}' 过滤并查询所有相关记录 (上限 {MAX_TOTAL_FETCH_RECORDS} 条)。"
             )
         else:
-            # 如果没有会话ID上下文，查询所有记录
-            expr = f"{PRIMARY_FIELD_NAME} >= 0"
+            # 如果没有会话ID上下文，查询所有记录。
+            # 空表达式表示"无过滤"，服务端可直接跳过过滤步骤，
+            # 比 "memory_id >= 0" 这种形式上的全量条件更省 CPU
+            expr = ""
             logger.info(
                 "未指定会话 ID，将查询集合 '{target_collection}' 中的所有记录 (上限 {MAX_TOTAL_FETCH_RECORDS} 条)。"
             )
-            # 或者，如果您的 milvus_manager 支持空表达式查询所有，则 expr = "" 或 None
 
         # logger.debug(f"查询集合 '{target_collection}' 记录: expr='{expr}'") # 上面已有更具体的日志
         output_fields = [
@@ -183,35 +260,122 @@ async def list_records_cmd_impl(
             f"准备查询 Milvus: 集合='{target_collection}', 表达式='{expr}', 限制={limit},输出字段={output_fields}, 总数上限={MAX_TOTAL_FETCH_RECORDS}"
         )
 
-        # 直接使用 Milvus 的 offset 和 limit 参数进行分页查询
-        # records = self.milvus_manager.query(
-        #     collection_name=target_collection,
-        #     expression=expr,
-        #     output_fields=output_fields,
-        #     limit=limit,
-        #     offset=offset,  # 直接使用函数参数 offset
-        # )
-
-        # 重要的修改：移除 Milvus query 的 offset 和 limit 参数，使用总数上限作为 Milvus 的 limit
-        fetched_records = self.milvus_manager.query(
-            collection_name=target_collection,
-            expression=expr,
-            output_fields=output_fields,
-            limit=MAX_TOTAL_FETCH_RECORDS,  # 使用总数上限作为 Milvus 的 limit
-        )
+        display_records: list[dict] | None = None
+        total_matched = 0
 
-        # 检查查询结果
-        if fetched_records is None:
-            # 查询失败，milvus_manager.query 通常会返回 None 或抛出异常
-            logger.error(
-                f"查询集合 '{target_collection}' 失败，milvus_manager.query 返回 None。"
+        if session_id:
+            # 按会话过滤的查询走合并器：50ms 窗口内多个用户的同类查询
+            # 会被合并为一个 `session_id in [...]` RPC，再按值分发结果
+            coalescer = self._query_coalescer
+            if coalescer is None:
+                coalescer = MilvusQueryCoalescer(self.milvus_manager)
+                self._query_coalescer = coalescer
+
+            fetched_records = await coalescer.query_eq(
+                collection_name=target_collection,
+                field="session_id",
+                value=session_id,
+                output_fields=output_fields,
+                limit=MAX_TOTAL_FETCH_RECORDS,
             )
-            yield event.plain_result(
-                f"⚠️ 查询集合 '{target_collection}' 记录失败，请检查日志。"
+            if fetched_records is None:
+                logger.error(
+                    f"查询集合 '{target_collection}' 失败，合并查询返回 None。"
+                )
+                yield event.plain_result(
+                    f"⚠️ 查询集合 '{target_collection}' 记录失败，请检查日志。"
+                )
+                return
+
+            total_matched = len(fetched_records)
+            # 单会话记录量有限，直接取最新的 limit 条
+            display_records = heapq.nlargest(
+                limit, fetched_records, key=lambda x: x.get("create_time") or 0
             )
-            return
+        else:
+            # 全量扫描优先使用查询迭代器分批拉取，内存中仅维护一个 limit
+            # 大小的小根堆，避免一次性物化最多 MAX_TOTAL_FETCH_RECORDS 条
+            # 记录再做全量排序。
+            iterator = await asyncio.to_thread(
+                self.milvus_manager.query_iterator,
+                collection_name=target_collection,
+                expression=expr,
+                output_fields=output_fields,
+                batch_size=min(max(limit * 4, 64), 1000),
+            )
+            if iterator is not None:
+                # 堆元素为 (create_time, 序号, record)，序号保证比较时不会触碰 dict
+                top_heap: list[tuple[float, int, dict]] = []
+                seq = 0
+                try:
+                    while True:
+                        batch = await asyncio.to_thread(iterator.next)
+                        if not batch:
+                            break
+                        total_matched += len(batch)
+                        for record in batch:
+                            ts_key = record.get("create_time") or 0
+                            seq += 1
+                            if len(top_heap) < limit:
+                                heapq.heappush(top_heap, (ts_key, seq, record))
+                            elif ts_key > top_heap[0][0]:
+                                heapq.heapreplace(top_heap, (ts_key, seq, record))
+                finally:
+                    try:
+                        await asyncio.to_thread(iterator.close)
+                    except Exception as close_e:
+                        logger.debug(f"关闭查询迭代器时出错（忽略）: {close_e}")
+                # 堆中即为最新的 limit 条，按 create_time 降序输出
+                top_heap.sort(reverse=True)
+                display_records = [item[2] for item in top_heap]
+            else:
+                # 回退路径：部署不支持查询迭代器时，仍按旧方式全量拉取后排序
+                logger.info("查询迭代器不可用，回退到批量查询 + 排序路径。")
+                fetched_records = await asyncio.to_thread(
+                    self.milvus_manager.query,
+                    collection_name=target_collection,
+                    expression=expr,
+                    output_fields=output_fields,
+                    limit=MAX_TOTAL_FETCH_RECORDS,  # 使用总数上限作为 Milvus 的 limit
+                )
+
+                if fetched_records is None:
+                    # 查询失败，milvus_manager.query 通常会返回 None 或抛出异常
+                    logger.error(
+                        f"查询集合 '{target_collection}' 失败，milvus_manager.query 返回 None。"
+                    )
+                    yield event.plain_result(
+                        f"⚠️ 查询集合 '{target_collection}' 记录失败，请检查日志。"
+                    )
+                    return
+
+                # 检查是否达到了总数上限
+                if len(fetched_records) >= MAX_TOTAL_FETCH_RECORDS:
+                    logger.warning(
+                        f"查询到的记录数量达到总数上限 ({MAX_TOTAL_FETCH_RECORDS})，可能存在更多未获取的记录，导致无法找到更旧的记录，但最新记录应该在获取范围内。"
+                    )
+                    yield event.plain_result(
+                        f"ℹ️ 警告：查询到的记录数量已达到系统获取最新记录的上限 ({MAX_TOTAL_FETCH_RECORDS})。如果记录非常多，可能无法显示更旧的内容，但最新记录应该已包含在内。"
+                    )
 
-        if not fetched_records:
+                total_matched = len(fetched_records)
+                logger.debug(f"成功获取到 {total_matched} 条原始记录用于选取。")
+                try:
+                    # 只需要最新的 limit 条：nlargest 为 O(N log limit)，
+                    # 避免对全量结果做 O(N log N) 排序
+                    display_records = heapq.nlargest(
+                        limit,
+                        fetched_records,
+                        key=lambda x: x.get("create_time") or 0,
+                    )
+                except Exception as sort_e:
+                    logger.warning(
+                        f"对查询结果进行选取时出错: {sort_e}。显示顺序可能不按时间排序。"
+                    )
+                    # 选取失败时退化为原始顺序的前 limit 条
+                    display_records = fetched_records[:limit]
+
+        if not display_records:
             # 查询成功，但没有返回任何记录
             session_filter_msg = f"在会话 '{session_id}' 中" if session_id else ""
             logger.info(
@@ -221,82 +385,20 @@ async def list_records_cmd_impl(
                 f"集合 '{target_collection}' {session_filter_msg} 中没有找到任何匹配的记忆记录。"
             )
             return
-        # 检查是否达到了总数上限
-        if len(fetched_records) >= MAX_TOTAL_FETCH_RECORDS:
-            logger.warning(
-                f"查询到的记录数量达到总数上限 ({MAX_TOTAL_FETCH_RECORDS})，可能存在更多未获取的记录，导致无法找到更旧的记录，但最新记录应该在获取范围内。"
-            )
-            yield event.plain_result(
-                f"ℹ️ 警告：查询到的记录数量已达到系统获取最新记录的上限 ({MAX_TOTAL_FETCH_RECORDS})。如果记录非常多，可能无法显示更旧的内容，但最新记录应该已包含在内。"
-            )
-
-        logger.debug(f"成功获取到 {len(fetched_records)} 条原始记录用于排序。")
-        # --- 在获取全部结果后进行排序 (按创建时间倒序) ---
-        # 这确保了排序是基于所有获取到的记录，找到真正的最新记录
-        try:
-            # 使用 lambda 表达式按 create_time 字段排序，如果字段不存在或为 None，默认为 0
-            fetched_records.sort(
-                key=lambda x: x.get("create_time", 0) or 0, reverse=True
-            )
-            logger.debug(
-                f"已将获取到的 {len(fetched_records)} 条记录按 create_time 降序排序。"
-            )
-        except Exception as sort_e:
-            logger.warning(
-                f"对查询结果进行排序时出错: {sort_e}。显示顺序可能不按时间排序。"
-            )
-            # 如果排序失败，继续处理，但不保证按时间顺序
-
-        # --- 在排序后获取最前的 limit 条记录 ---
-        # 从排序后的 fetched_records 中取出最前的 limit 条记录
-        display_records = fetched_records[:limit]
-
-        # display_records 不会为空，除非 fetched_records 本身就为空，
-        # 而 fetched_records 为空的情况已经在前面处理过了。
 
         # 准备响应消息
-        total_fetched = len(fetched_records)
+        total_fetched = total_matched
         display_count = len(display_records)
-        # 消息提示用户这是最新的记录
+        # 消息提示用户这是最新的记录；正文通过列表推导一次性构建后
+        # 单次 join，避免循环内反复 append 触发的列表扩容
+        header = f"📜 集合 '{target_collection}' 的最新记忆记录 (共获取 {total_fetched} 条进行排序, 显示最新的 {display_count} 条):"
         response_lines = [
-            f"📜 集合 '{target_collection}' 的最新记忆记录 (共获取 {total_fetched} 条进行排序, 显示最新的 {display_count} 条):"
+            _format_record_line(i, record)
+            for i, record in enumerate(display_records, start=1)
         ]
 
-        # 格式化每条记录以供显示
-        # 使用 enumerate 从 1 开始生成序号
-        for i, record in enumerate(display_records, start=1):
-            ts = record.get("create_time")
-            try:
-                # 根据 Milvus 文档，Query 结果中的 time 是 float 类型的 Unix 时间戳（秒）。
-                time_str = (
-                    datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
-                    if ts is not None  # 检查 ts 是否存在且不是 None
-                    else "未知时间"
-                )
-            except (TypeError, ValueError, OSError) as time_e:
-                # 处理无效或无法解析的时间戳
-                logger.warning(
-                    f"记录 {record.get(PRIMARY_FIELD_NAME, '未知ID')} 的时间戳 '{ts}' 无效或解析错误: {time_e}"
-                )
-                time_str = f"无效时间戳({ts})" if ts is not None else "未知时间"
-
-            content = record.get("content", "内容不可用")
-            # 截断过长的内容以优化显示
-            content_preview = content[:200] + ("..." if len(content) > 200 else "")
-            record_session_id = record.get("session_id", "未知会话")
-            persona_id = record.get("personality_id", "未知人格")
-            pk = record.get(PRIMARY_FIELD_NAME, "未知ID")  # 获取主键
-
-            response_lines.append(
-                f"#{i} [ID: {pk}]\n"  # 使用从 1 开始的序号
-                f"  时间: {time_str}\n"
-                f"  人格: {persona_id}\n"
-                f"  会话: {record_session_id}\n"
-                f"  内容: {content_preview}"
-            )
-
         # 发送格式化后的结果
-        yield event.plain_result("\n\n".join(response_lines))
+        yield event.plain_result("\n\n".join([header, *response_lines]))
 
     except Exception as e:
         # 捕获所有其他潜在异常
@@ -344,9 +446,7 @@ async def delete_session_memory_cmd_impl(
 
         # 使用安全的表达式构建方法，防止注入
         try:
-            expr = safe_build_milvus_expression(
-                "session_id", session_id_to_delete, "=="
-            )
+            expr = build_eq_expr("session_id", session_id_to_delete)
         except ValueError as e:
             yield event.plain_result(f"⚠️ 构建删除表达式失败: {e}")
             logger.error(f"构建删除表达式时出错: {e}")
@@ -357,8 +457,10 @@ async def delete_session_memory_cmd_impl(
             f"管理员 {sender_id} 请求删除会话 '{session_id_to_delete}' 的所有记忆 (集合: {collection_name}, 表达式: '{expr}') (确认执行)"
         )
 
-        mutation_result = self.milvus_manager.delete(
-            collection_name=collection_name, expression=expr
+        mutation_result = await asyncio.to_thread(
+            self.milvus_manager.delete,
+            collection_name=collection_name,
+            expression=expr,
         )
 
         if mutation_result:
@@ -374,7 +476,9 @@ async def delete_session_memory_cmd_impl(
                 logger.info(
                     f"正在刷新 (Flush) 集合 '{collection_name}' 以应用删除操作..."
                 )
-                self.milvus_manager.flush([collection_name])
+                await asyncio.to_thread(
+                    self.milvus_manager.flush, [collection_name]
+                )
                 logger.info(f"集合 '{collection_name}' 刷新完成。删除操作已生效。")
                 yield event.plain_result(
                     f"✅ 已成功删除会话 ID '{session_id_to_delete}' 的所有记忆信息。"
@@ -434,7 +538,7 @@ async def init_memory_system_cmd_impl(
         # 通过调用一个轻量级操作来触发连接（如果尚未连接）
         if not self.milvus_manager.is_connected():
             # 尝试连接
-            self.milvus_manager.list_collections()
+            await asyncio.to_thread(self.milvus_manager.list_collections)
     except Exception as e:
         logger.error(f"尝试连接 Milvus 失败: {e}")
         yield event.plain_result(
@@ -477,9 +581,13 @@ async def init_memory_system_cmd_impl(
         old_dim = None
 
         # 检查集合是否已存在
-        if self.milvus_manager.has_collection(collection_name):
+        if await asyncio.to_thread(
+            self.milvus_manager.has_collection, collection_name
+        ):
             # 检查现有集合的维度
-            collection = self.milvus_manager.get_collection(collection_name)
+            collection = await asyncio.to_thread(
+                self.milvus_manager.get_collection, collection_name
+            )
             if collection:
                 for field in collection.schema.fields:
                     if field.name == "embedding":  # 向量字段名
@@ -520,15 +628,18 @@ async def init_memory_system_cmd_impl(
                     logger.error("plugin_data_dir 未初始化，无法进行备份")
                     return
 
-                # 创建备份目录
-
-                backup_dir = Path(self.plugin_data_dir) / "backups"
-                try:
-                    backup_dir.mkdir(parents=True, exist_ok=True)
-                except Exception as e:
-                    yield event.plain_result(f"⚠️ 无法创建备份目录: {e}，迁移中止")
-                    logger.error(f"创建备份目录失败: {e}")
-                    return
+                # 创建备份目录（首次 mkdir 成功后缓存在实例上，后续调用
+                # 跳过 Path 构造和 mkdir 系统调用——NFS 上后者可能高达几十毫秒）
+                backup_dir = self._backup_dir
+                if backup_dir is None:
+                    backup_dir = Path(self.plugin_data_dir) / "backups"
+                    try:
+                        backup_dir.mkdir(parents=True, exist_ok=True)
+                    except Exception as e:
+                        yield event.plain_result(f"⚠️ 无法创建备份目录: {e}，迁移中止")
+                        logger.error(f"创建备份目录失败: {e}")
+                        return
+                    self._backup_dir = backup_dir
 
                 timestamp = int(time_module.time())
                 backup_file = (
@@ -544,74 +655,136 @@ async def init_memory_system_cmd_impl(
                 batch_size = 16384  # Milvus 单次查询上限
                 offset = 0
 
+                # 边导出边流式写入备份文件：逐条序列化记录，避免同时持有
+                # 全量记录列表和完整的序列化字符串；不使用 indent 以节省
+                # 字节量和序列化 CPU。record_count 在所有记录写完后补在末尾。
+                # 先写入 .tmp 文件，结尾处统一 fsync 后原子重命名为正式文件，
+                # 保证崩溃时不会留下被误认为完整备份的半成品。
+                backup_tmp = backup_file.with_suffix(".json.tmp")
                 try:
-                    while True:
-                        batch_records = self.milvus_manager.query(
+                    with open(backup_tmp, "w", encoding="utf-8") as f:
+                        f.write(
+                            f'{{"collection_name": {_json_dumps(collection_name)}, '
+                            f'"old_dimension": {_json_dumps(old_dim)}, '
+                            f'"new_dimension": {current_dim}, '
+                            f'"timestamp": {timestamp}, '
+                            f'"records": ['
+                        )
+                        first_record = True
+                        export_fields = [
+                            "content",
+                            "create_time",
+                            "session_id",
+                            "personality_id",
+                        ]
+
+                        def _dump_batch(batch_records: list[dict]):
+                            nonlocal first_record
+                            for record in batch_records:
+                                if first_record:
+                                    first_record = False
+                                else:
+                                    f.write(", ")
+                                f.write(_json_dumps(record))
+                            all_records.extend(batch_records)
+                            logger.info(f"已导出 {len(all_records)} 条记录...")
+
+                        # 优先使用查询迭代器（空表达式 = 无过滤全量扫描），
+                        # 避免 offset 分页要求服务端物化并丢弃前 N 行
+                        iterator = await asyncio.to_thread(
+                            self.milvus_manager.query_iterator,
                             collection_name=collection_name,
-                            expression=f"{PRIMARY_FIELD_NAME} >= 0",
-                            output_fields=[
-                                "content",
-                                "create_time",
-                                "session_id",
-                                "personality_id",
-                            ],
-                            limit=batch_size,
-                            offset=offset,
+                            expression="",
+                            output_fields=export_fields,
+                            batch_size=batch_size,
                         )
-
-                        if not batch_records:
-                            break
-
-                        all_records.extend(batch_records)
-                        offset += len(batch_records)
-
-                        logger.info(f"已导出 {len(all_records)} 条记录...")
-
-                        # 如果本批次少于batch_size，说明已经到达末尾
-                        if len(batch_records) < batch_size:
-                            break
+                        if iterator is not None:
+                            try:
+                                while True:
+                                    batch_records = await asyncio.to_thread(
+                                        iterator.next
+                                    )
+                                    if not batch_records:
+                                        break
+                                    _dump_batch(batch_records)
+                            finally:
+                                try:
+                                    await asyncio.to_thread(iterator.close)
+                                except Exception as close_e:
+                                    logger.debug(
+                                        f"关闭导出迭代器时出错（忽略）: {close_e}"
+                                    )
+                        else:
+                            # 回退路径：offset 分页导出。每轮通过 asyncio.to_thread
+                            # 并发发起多个分页查询，利用 Milvus 服务端的多线程扫描；
+                            # 结果仍按 offset 顺序写入备份文件
+                            logger.info(
+                                "查询迭代器不可用，回退到并发 offset 分页导出。"
+                            )
+                            export_concurrency = min(4, os.cpu_count() or 1)
+                            done = False
+                            while not done:
+                                batch_results = await asyncio.gather(
+                                    *(
+                                        asyncio.to_thread(
+                                            self.milvus_manager.query,
+                                            collection_name=collection_name,
+                                            expression="",
+                                            output_fields=export_fields,
+                                            limit=batch_size,
+                                            offset=offset + i * batch_size,
+                                        )
+                                        for i in range(export_concurrency)
+                                    )
+                                )
+                                for batch_records in batch_results:
+                                    if not batch_records:
+                                        done = True
+                                        break
+                                    _dump_batch(batch_records)
+                                    offset += len(batch_records)
+                                    # 如果本批次少于batch_size，说明已经到达末尾
+                                    if len(batch_records) < batch_size:
+                                        done = True
+                                        break
+
+                        f.write(f'], "record_count": {len(all_records)}}}')
+                        # 单次 fsync 足够：之前的写入由页缓存合并，只需保证
+                        # rename 之前数据已落盘
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(backup_tmp, backup_file)
 
                     if not all_records:
                         logger.warning("旧集合中没有数据，将创建新集合。")
 
                 except Exception as e:
-                    logger.error(f"导出旧数据失败: {e}")
-                    yield event.plain_result(f"⚠️ 导出旧数据失败: {e}，迁移中止")
-                    return
-
-                record_count = len(all_records)
-
-                # 保存备份到文件 - 备份失败则终止整个操作
-                try:
-                    backup_data = {
-                        "collection_name": collection_name,
-                        "old_dimension": old_dim,
-                        "new_dimension": current_dim,
-                        "timestamp": timestamp,
-                        "record_count": record_count,
-                        "records": all_records,
-                    }
-                    with open(backup_file, "w", encoding="utf-8") as f:
-                        json.dump(backup_data, f, ensure_ascii=False, indent=2)
-                    logger.info(f"已将 {record_count} 条记录备份到: {backup_file}")
-                    yield event.plain_result(
-                        f"✅ 已导出并备份 {record_count} 条记录\n"
-                        f"备份文件: {backup_file.name}"
-                    )
-                except Exception as e:
-                    logger.error(f"保存备份文件失败: {e}")
+                    logger.error(f"导出并备份旧数据失败: {e}")
+                    try:
+                        backup_tmp.unlink(missing_ok=True)
+                    except OSError:
+                        pass
                     yield event.plain_result(
-                        f"⚠️ 保存备份文件失败: {e}\n"
+                        f"⚠️ 导出并备份旧数据失败: {e}\n"
                         f"为保证数据安全，迁移操作已终止。\n"
                         f"请检查磁盘空间和文件权限后重试。"
                     )
                     return
 
+                record_count = len(all_records)
+                logger.info(f"已将 {record_count} 条记录备份到: {backup_file}")
+                yield event.plain_result(
+                    f"✅ 已导出并备份 {record_count} 条记录\n"
+                    f"备份文件: {backup_file.name}"
+                )
+
                 old_records = all_records
 
                 # 删除旧集合
                 logger.info(f"删除旧集合 '{collection_name}'...")
-                if not self.milvus_manager.drop_collection(collection_name):
+                if not await asyncio.to_thread(
+                    self.milvus_manager.drop_collection, collection_name
+                ):
                     yield event.plain_result("⚠️ 删除旧集合失败")
                     return
                 yield event.plain_result("✅ 已删除旧集合")
@@ -621,8 +794,6 @@ async def init_memory_system_cmd_impl(
                 self.config["embedding_dim"] = current_dim
 
                 # 重新初始化 schema
-                from . import initialization
-
                 initialization.initialize_config_and_schema(self)
 
                 # 创建新集合
@@ -638,55 +809,109 @@ async def init_memory_system_cmd_impl(
                     )
                     success_count = 0
                     fail_count = 0
+                    embed_batch_size = 64
+
+                    # 优先使用 provider 的批量接口，一次请求生成整批向量；
+                    # 不支持批量时退化为批内逐条生成。
+                    batch_embed_fn = getattr(
+                        self.embedding_provider, "get_embeddings", None
+                    )
+
+                    # 无批量接口时并发提交批内请求，用信号量限制在途数量，
+                    # 重叠网络往返而不会无界增长内存
+                    embed_semaphore = asyncio.Semaphore(16)
 
-                    for i, record in enumerate(old_records):
+                    # 缺失 create_time 时的统一兜底时间戳：在循环外取一次
+                    # time.time()，避免每行构造 datetime 对象
+                    now_ts = int(time_module.time())
+
+                    async def _embed_one(text: str):
+                        async with embed_semaphore:
+                            return await self.embedding_provider.get_embedding(text)
+
+                    for start in range(0, record_count, embed_batch_size):
+                        chunk = old_records[start : start + embed_batch_size]
                         try:
-                            content = record.get("content", "")
-                            if not content:
-                                continue
+                            # 一次遍历按列抽取（SoA），后续按下标访问，
+                            # 避免组装每行时对 dict 的重复 .get 探查
+                            texts: list[str] = []
+                            personality_ids: list[str] = []
+                            session_ids: list[str] = []
+                            create_times: list[int] = []
+                            for record in chunk:
+                                content = record.get("content", "")
+                                if not content:
+                                    continue
+                                texts.append(content)
+                                personality_ids.append(
+                                    record.get("personality_id", "")
+                                )
+                                session_ids.append(record.get("session_id", ""))
+                                create_times.append(
+                                    record.get("create_time") or now_ts
+                                )
 
-                            # 生成新向量
-                            embedding = await self.embedding_provider.get_embedding(
-                                content
-                            )
-                            if not embedding:
-                                fail_count += 1
+                            if not texts:
                                 continue
 
-                            # 插入新记录 - 使用类型标注避免 Pylance 错误
-                            insert_data: list = [
-                                {
-                                    "personality_id": record.get("personality_id", ""),
-                                    "session_id": record.get("session_id", ""),
-                                    "content": content,
-                                    "embedding": embedding,
-                                    "create_time": record.get(
-                                        "create_time", int(datetime.now().timestamp())
-                                    ),
-                                }
-                            ]
-
-                            result = self.milvus_manager.insert(
-                                collection_name, insert_data
-                            )
-                            if result:
-                                success_count += 1
+                            # 生成新向量（批量一次 RPC，或批内逐条）
+                            if callable(batch_embed_fn):
+                                embeddings = await batch_embed_fn(texts)
                             else:
-                                fail_count += 1
+                                embeddings = await asyncio.gather(
+                                    *(_embed_one(text) for text in texts),
+                                    return_exceptions=True,
+                                )
+
+                            # 组装整批插入数据 - 使用类型标注避免 Pylance 错误
+                            insert_data: list = []
+                            for idx, embedding in enumerate(embeddings):
+                                if isinstance(embedding, BaseException):
+                                    logger.error(f"生成向量失败: {embedding}")
+                                    fail_count += 1
+                                    continue
+                                if not embedding:
+                                    fail_count += 1
+                                    continue
+                                insert_data.append(
+                                    {
+                                        "personality_id": personality_ids[idx],
+                                        "session_id": session_ids[idx],
+                                        "content": texts[idx],
+                                        "embedding": embedding,
+                                        "create_time": create_times[idx],
+                                    }
+                                )
 
-                            # 每10条记录报告一次进度
-                            if (i + 1) % 10 == 0:
-                                yield event.plain_result(
-                                    f"进度: {i + 1}/{record_count} "
-                                    f"(成功: {success_count}, 失败: {fail_count})"
+                            # 整批一次插入，摊薄 Milvus 往返开销
+                            if insert_data:
+                                result = await asyncio.to_thread(
+                                    self.milvus_manager.insert,
+                                    collection_name,
+                                    insert_data,
                                 )
+                                if result:
+                                    success_count += len(insert_data)
+                                else:
+                                    fail_count += len(insert_data)
 
                         except Exception as e:
-                            logger.error(f"处理记录 {i} 时出错: {e}")
-                            fail_count += 1
+                            logger.error(
+                                f"处理记录批次 {start}-{start + len(chunk)} 时出错: {e}"
+                            )
+                            fail_count += len(chunk)
+
+                        # 每批报告一次进度
+                        processed = min(start + embed_batch_size, record_count)
+                        yield event.plain_result(
+                            f"进度: {processed}/{record_count} "
+                            f"(成功: {success_count}, 失败: {fail_count})"
+                        )
 
                     # Flush 确保数据持久化
-                    self.milvus_manager.flush([collection_name])
+                    await asyncio.to_thread(
+                        self.milvus_manager.flush, [collection_name]
+                    )
 
                     yield event.plain_result(
                         f"✅ 数据迁移完成！\n"
@@ -708,8 +933,6 @@ async def init_memory_system_cmd_impl(
             yield event.plain_result(f"📝 集合 '{collection_name}' 不存在，正在创建...")
 
             self.config["embedding_dim"] = current_dim
-            from . import initialization
-
             initialization.initialize_config_and_schema(self)
             initialization.setup_milvus_collection_and_index(
                 self, skip_if_not_ready=False
@@ -743,8 +966,7 @@ async def debug_summary_cmd_impl(self: "Mnemosyne", event: AstrMessageEvent):
     history_list = self.context_manager.get_history(session_id)
     
     # [OneBot 漫游消息支持] 尝试直接从适配器获取漫游消息
-    from .memory_operations import _try_fetch_roaming_history, _get_persona_id, handle_summary_long_memory
-    
+
     # 获取上次总结时间，模拟真实的增量获取
     last_summary_time = 0
     if self.context_manager:
@@ -776,9 +998,8 @@ async def debug_summary_cmd_impl(self: "Mnemosyne", event: AstrMessageEvent):
                 conversation = await conv_mgr.get_conversation(session_id, curr_cid)
                 if conversation and conversation.history:
                     # AstrBot 存储的 history 是 JSON 字符串或 list of dicts
-                    import json
                     if isinstance(conversation.history, str):
-                        history_list = json.loads(conversation.history)
+                        history_list = _json_loads(conversation.history)
                     elif isinstance(conversation.history, list):
                         history_list = conversation.history
                     
@@ -793,7 +1014,6 @@ async def debug_summary_cmd_impl(self: "Mnemosyne", event: AstrMessageEvent):
         yield event.plain_result(f"🔍 正在读取最近 {len(history_list)} 条历史记录 (AstrBot Core DB)...")
 
         # 2. 格式化历史 (Input)
-        from .tools import format_context_to_string
         # 传递足够大的轮数以包含所有历史
         history_str = format_context_to_string(history_list, len(history_list) * 2)
     
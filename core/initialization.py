@@ -152,7 +152,14 @@ def initialize_config_and_schema(plugin: "Mnemosyne"):
             ),  # 增加了长度限制
             FieldSchema(
                 name=VECTOR_FIELD_NAME,
-                dtype=DataType.FLOAT_VECTOR,
+                # 开启 use_fp16_vectors 后以半精度存储向量：网络传输与索引
+                # 内存减半，检索精度损失可忽略。已存在的集合需通过
+                # `/memory init --force` 迁移才会使用新类型。
+                dtype=(
+                    DataType.FLOAT16_VECTOR
+                    if plugin.config.get("use_fp16_vectors", False)
+                    else DataType.FLOAT_VECTOR
+                ),
                 dim=embedding_dim,
                 description="记忆的嵌入向量",
             ),
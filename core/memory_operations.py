@@ -308,11 +308,12 @@ async def _try_fetch_roaming_history(
         # 2. 解析上下文
         if plugin.context_manager:
             session_ctx = plugin.context_manager.get_session_context(session_id)
-            if session_ctx and "event" in session_ctx:
-                event = session_ctx["event"]
-                group_id = event.get_group_id()
-                platform_name = event.get_platform_name()
-                client = getattr(event, "bot", None)
+            # 会话中存储的是轻量事件快照 (SessionEventRef)，字段已预先提取
+            event_ref = session_ctx.get("event") if session_ctx else None
+            if event_ref is not None:
+                group_id = event_ref.group_id
+                platform_name = event_ref.platform_name
+                client = event_ref.bot
             else:
                 return None, None, None
         else:
@@ -3,6 +3,7 @@ Mnemosyne 插件安全工具模块
 提供输入验证、SQL注入防护、路径遍历防护等安全功能
 """
 
+import functools
 import re
 from pathlib import Path
 
@@ -13,6 +14,9 @@ logger = LogManager.GetLogger(log_name="MnemosyneSecurity")
 
 # ==================== SQL注入防护 ====================
 
+# 允许出现在过滤表达式中的字段名白名单
+ALLOWED_FILTER_FIELDS = ["session_id", "personality_id", "user_id", "memory_id"]
+
 
 def validate_session_id(session_id: str) -> bool:
     """
@@ -85,10 +89,9 @@ def safe_build_milvus_expression(field: str, value: str, operator: str = "==") -
         ValueError: 如果字段名不在白名单或操作符不支持
     """
     # 字段名白名单
-    allowed_fields = ["session_id", "personality_id", "user_id", "memory_id"]
-    if field not in allowed_fields:
+    if field not in ALLOWED_FILTER_FIELDS:
         raise ValueError(
-            f"不允许的字段名: {field}. 只允许: {', '.join(allowed_fields)}"
+            f"不允许的字段名: {field}. 只允许: {', '.join(ALLOWED_FILTER_FIELDS)}"
         )
 
     # 操作符白名单
@@ -116,6 +119,33 @@ def safe_build_milvus_expression(field: str, value: str, operator: str = "==") -
     return expr
 
 
+@functools.lru_cache(maxsize=1024)
+def build_eq_expr(field: str, value: str) -> str:
+    """
+    构建等值过滤表达式的快速路径（带 LRU 缓存）
+
+    与 safe_build_milvus_expression(field, value, "==") 的结果一致，但跳过
+    操作符分支和诊断日志，并缓存重复的 (field, value) 组合——聊天场景下
+    同一会话会反复构建相同的表达式。调用方必须先完成字段值校验
+    （如 validate_session_id / validate_personality_id）。
+
+    Args:
+        field: 字段名（必须在白名单中）
+        value: 字段值（已通过校验）
+
+    Returns:
+        str: 等值过滤表达式
+
+    Raises:
+        ValueError: 如果字段名不在白名单
+    """
+    if field not in ALLOWED_FILTER_FIELDS:
+        raise ValueError(
+            f"不允许的字段名: {field}. 只允许: {', '.join(ALLOWED_FILTER_FIELDS)}"
+        )
+    return f'{field} == "{value}"'
+
+
 # ==================== 路径遍历防护 ====================
 
 
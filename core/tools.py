@@ -3,7 +3,9 @@ Mnemosyne 插件工具函数
 """
 
 import functools
+import logging
 import re
+import sys
 from typing import Any
 from urllib.parse import urlparse
 
@@ -12,11 +14,51 @@ from astrbot.core.log import LogManager
 
 logger = LogManager.GetLogger(__name__)
 
+# 记忆注入标签的匹配模式。模块级编译一次，避免每次调用时
+# 重新走 re.compile 的编译/缓存查找路径（这些函数每轮 LLM 调用都会执行）
+_MNEMOSYNE_RE = re.compile(r"<Mnemosyne>.*?</Mnemosyne>", re.DOTALL)
+_MN_OPEN = "<Mnemosyne>"
+_MN_CLOSE = "</Mnemosyne>"
 
+
+def _strip_all_mnemosyne_blocks(text: str) -> str:
+    """
+    删除 text 中所有 <Mnemosyne>...</Mnemosyne> 块。
+
+    与 _MNEMOSYNE_RE.sub("", text) 语义一致（非贪婪、跨行），但全程
+    只做 C 层的 str.find 和切片——对这种纯字面量模式比正则引擎快数倍。
+    未闭合的开标签与正则行为相同：不视为匹配，原样保留。
+    """
+    i = text.find(_MN_OPEN)
+    if i == -1:
+        return text
+    parts: list[str] = []
+    prev = 0
+    open_len = len(_MN_OPEN)
+    close_len = len(_MN_CLOSE)
+    while i != -1:
+        j = text.find(_MN_CLOSE, i + open_len)
+        if j == -1:
+            break
+        parts.append(text[prev:i])
+        prev = j + close_len
+        i = text.find(_MN_OPEN, prev)
+    parts.append(text[prev:])
+    return "".join(parts)
+
+# format_context_to_string 的角色归一化与时间戳取值表。
+# 模块级常量避免每条消息重建临时 list 做成员测试
+_ROLE_USER_KEYS = frozenset({"user", "human"})
+_ROLE_AI_KEYS = frozenset({"assistant", "model", "ai"})
+_TS_KEYS = ("timestamp", "created_at", "time")
+
+
+@functools.lru_cache(maxsize=32)
 def parse_address(address: str):
     """
     解析地址，提取出主机名和端口号。
     如果地址没有协议前缀，则默认添加 "http://"
+    地址基数极低且结果不可变，lru_cache 让重复连接/重连时免去 urlparse 开销。
     """
     if not (address.startswith("http://") or address.startswith("https://")):
         address = "http://" + address
@@ -37,9 +79,12 @@ def content_to_str(func):
     def wrapper(*args, **kwargs):
         str_args = [str(arg) for arg in args]
         str_kwargs = {k: str(v) for k, v in kwargs.items()}
-        logger.debug(
-            f"Function '{func.__name__}' called with arguments: args={str_args}, kwargs={str_kwargs}"
-        )
+        # f-string 的构建成本不小（要对全部参数做 repr 拼接），
+        # 仅在 DEBUG 级别启用时才组装日志内容
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"Function '{func.__name__}' called with arguments: args={str_args}, kwargs={str_kwargs}"
+            )
         return func(*str_args, **str_kwargs)
 
     return wrapper
@@ -54,69 +99,85 @@ def remove_mnemosyne_tags(
     - contexts_memory_len == 0: 移除所有标签对。
     - contexts_memory_len < 0: 保留所有标签对，不作任何删除。
     """
-    if contexts_memory_len < 0:
+    if contexts_memory_len < 0 or not contents:
         return contents
 
-    compiled_regex = re.compile(r"<Mnemosyne>.*?</Mnemosyne>", re.DOTALL)
-    cleaned_contents: list[dict[str, Any]] = []
+    # 输出恒与输入等长：先做一次 C 层整体浅拷贝，再就地替换需要
+    # 清理的条目，避免逐条 append 触发的几何扩容
+    cleaned_contents: list[dict[str, Any]] = list(contents)
 
     if contexts_memory_len == 0:
-        for content_item in contents:
+        for i, content_item in enumerate(contents):
             if isinstance(content_item, dict) and content_item.get("role") == "user":
                 original_text = content_item.get("content", "")
                 # 关键修复：多模态内容（list/dict 等）不能强制转换为字符串。
                 # 只有在 content 为 str 时才需要清理标签。
-                if isinstance(original_text, str):
-                    cleaned_text = compiled_regex.sub("", original_text)
-                    cleaned_contents.append({"role": "user", "content": cleaned_text})
-                else:
-                    cleaned_contents.append(content_item)
-            else:
-                cleaned_contents.append(content_item)
+                # 先用 C 层的子串判断快速排除不含标签的消息（绝大多数），
+                # 避免无谓地启动正则引擎
+                if isinstance(original_text, str) and "<Mnemosyne>" in original_text:
+                    cleaned_text = _strip_all_mnemosyne_blocks(original_text)
+                    # 浅拷贝原消息后只替换 content：保留 name/timestamp 等
+                    # 元数据字段（format_context_to_string 会读取），
+                    # 也比字典字面量省去重新哈希各键的开销
+                    cleaned_item = content_item.copy()
+                    cleaned_item["content"] = cleaned_text
+                    cleaned_contents[i] = cleaned_item
     else:  # contexts_memory_len > 0
-        all_mnemosyne_blocks: list[str] = []
+        # 单趟 finditer 收集每条 user 消息中标签块的位置（span）。
+        # 相比旧的 findall + set(块文本) 方案：正则只扫一遍；去留判断
+        # 基于全局出现序号（整数比较）而非对整块文本做哈希；且内容相同
+        # 的重复块不会因 set 去重而破坏"保留最后 N 个"的语义。
+        hits_per_item: list[list[tuple[int, int]] | None] = []
+        total_hits = 0
         for content_item in contents:
+            spans: list[tuple[int, int]] | None = None
             if isinstance(content_item, dict) and content_item.get("role") == "user":
                 original_text = content_item.get("content", "")
                 if isinstance(original_text, str):
-                    found_blocks = compiled_regex.findall(original_text)
-                    all_mnemosyne_blocks.extend(found_blocks)
-
-        blocks_to_keep: set[str] = set(all_mnemosyne_blocks[-contexts_memory_len:])
-
-        def replace_logic(match: re.Match) -> str:
-            block = match.group(0)
-            return block if block in blocks_to_keep else ""
-
-        for content_item in contents:
-            if isinstance(content_item, dict) and content_item.get("role") == "user":
-                original_text = content_item.get("content", "")
-
-                # M14 修复: 改进逻辑流程，确保正确处理各种情况
-                # 使用 elif 形成互斥逻辑，避免重复处理
-                if isinstance(original_text, list):
-                    # 1. 如果内容是列表（多模态消息），直接保留原样
-                    cleaned_contents.append({"role": "user", "content": original_text})
-                elif isinstance(original_text, str):
-                    # 2. 如果内容是字符串，检查是否需要清理标签
-                    if compiled_regex.search(original_text):
-                        # 内容包含标签，进行清理
-                        cleaned_text = compiled_regex.sub(replace_logic, original_text)
-                        cleaned_contents.append(
-                            {"role": "user", "content": cleaned_text}
-                        )
-                    else:
-                        # 内容不包含标签，直接保留
-                        cleaned_contents.append(content_item)
-                else:
-                    # 3. 其他类型（不应该出现），记录警告并保留原始内容
+                    # 子串判断先行，不含标签的字符串直接跳过正则扫描
+                    if "<Mnemosyne>" in original_text:
+                        spans = [
+                            m.span() for m in _MNEMOSYNE_RE.finditer(original_text)
+                        ]
+                        total_hits += len(spans)
+                elif not isinstance(original_text, list):
+                    # 多模态列表正常保留；其他类型（不应该出现）记录警告
                     logger.warning(
                         f"遇到意外的 content 类型: {type(original_text).__name__}，将保留原始内容"
                     )
-                    cleaned_contents.append(content_item)
-            else:
-                # 非 user 角色的消息，直接保留
-                cleaned_contents.append(content_item)
+            hits_per_item.append(spans)
+
+        # 全局序号 >= threshold 的块保留（即最后 contexts_memory_len 个）。
+        # 短历史（如 ≤5 条消息）里块数往往不超过保留配额，此时结果
+        # 与输入完全相同，直接返回原列表，跳过整个重建过程
+        threshold = total_hits - contexts_memory_len
+        if threshold <= 0:
+            return contents
+        seen = 0
+        for i, spans in enumerate(hits_per_item):
+            if not spans:
+                # 无标签块（含非 user / 多模态 / 无匹配），原样保留
+                continue
+            if seen >= threshold:
+                # 剩余的块全部在保留范围内，无需重组字符串
+                seen += len(spans)
+                continue
+
+            # 围绕需删除的 span 切片重组，单次 join 避免逐段拼接
+            content_item = contents[i]
+            original_text = content_item["content"]
+            pieces: list[str] = []
+            pos = 0
+            for start, end in spans:
+                if seen < threshold:
+                    pieces.append(original_text[pos:start])
+                    pos = end
+                seen += 1
+            pieces.append(original_text[pos:])
+            # 同样浅拷贝保留元数据字段，只替换清理后的 content
+            cleaned_item = content_item.copy()
+            cleaned_item["content"] = "".join(pieces)
+            cleaned_contents[i] = cleaned_item
 
     return cleaned_contents
 
@@ -132,22 +193,28 @@ def remove_system_mnemosyne_tags(text: str, contexts_memory_len: int = 0) -> str
     if contexts_memory_len < 0:
         return text
 
-    compiled_regex = re.compile(r"<Mnemosyne>.*?</Mnemosyne>", re.DOTALL)
+    # 系统提示通常不含标签，子串判断提前返回，完全绕开正则引擎
+    if "<Mnemosyne>" not in text:
+        return text
 
     if contexts_memory_len == 0:
-        cleaned_text = compiled_regex.sub("", text)
+        cleaned_text = _strip_all_mnemosyne_blocks(text)
     else:
-        all_mnemosyne_blocks: list[str] = compiled_regex.findall(text)
-        blocks_to_keep: set[str] = set(all_mnemosyne_blocks[-contexts_memory_len:])
-
-        def replace_logic(match: re.Match) -> str:
-            block = match.group(0)
-            return block if block in blocks_to_keep else ""
-
-        if compiled_regex.search(text):
-            cleaned_text = compiled_regex.sub(replace_logic, text)
-        else:
-            cleaned_text = text
+        # 单趟 finditer 取 span 后切片重组：去留按全局出现序号判断
+        # （保留最后 N 个），且不走 re.sub 的 Python 回调——后者每个
+        # 匹配都要跨一次 C/Python 边界
+        spans = [m.span() for m in _MNEMOSYNE_RE.finditer(text)]
+        threshold = len(spans) - contexts_memory_len
+        if threshold <= 0:
+            # 块数不超过保留配额，原文即结果
+            return text
+        parts: list[str] = []
+        prev = 0
+        for start, end in spans[:threshold]:
+            parts.append(text[prev:start])
+            prev = end
+        parts.append(text[prev:])
+        cleaned_text = "".join(parts)
 
     return cleaned_text
 
@@ -164,23 +231,110 @@ def remove_system_content(
     if contexts_memory_len < 0:
         return contents
 
-    system_message_indices = [
-        i
-        for i, msg in enumerate(contents)
-        if isinstance(msg, dict) and msg.get("role") == "system"
-    ]
-    indices_to_remove: set[int] = set()
-    num_system_messages = len(system_message_indices)
+    # 单趟倒序遍历：从最新消息往回数，配额内的 system 消息保留，
+    # 超额（更旧）的丢弃。省掉旧实现的索引列表、indices_to_remove
+    # set 以及第二次 enumerate + 哈希查找
+    remaining = contexts_memory_len
+    kept_reversed: list[dict[str, str]] = []
+    for msg in reversed(contents):
+        if isinstance(msg, dict) and msg.get("role") == "system":
+            if remaining <= 0:
+                continue
+            remaining -= 1
+        kept_reversed.append(msg)
 
-    if num_system_messages > contexts_memory_len:
-        num_to_remove = num_system_messages - contexts_memory_len
-        indices_to_remove = set(system_message_indices[:num_to_remove])
+    kept_reversed.reverse()
+    return kept_reversed
 
-    cleaned_contents = [
-        msg for i, msg in enumerate(contents) if i not in indices_to_remove
-    ]
 
-    return cleaned_contents
+def _truncate_text(text: str, max_chars: int = 2000) -> str:
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + "...(truncated)"
+
+
+def _part_text(item: dict) -> str | None:
+    text = item.get("text")
+    if isinstance(text, str) and text.strip():
+        return _truncate_text(text)
+    return None
+
+
+def _part_image(item: dict) -> str:
+    return "[图片]"
+
+
+def _part_audio(item: dict) -> str:
+    return "[音频]"
+
+
+def _part_fallback(item: dict) -> str | None:
+    """未知 type 的兜底：按关键字段识别图/音频，否则以类型名占位。"""
+    if "image_url" in item:
+        return "[图片]"
+    if "audio_url" in item:
+        return "[音频]"
+    item_type = item.get("type")
+    if isinstance(item_type, str) and item_type:
+        return f"[{item_type}]"
+    return None
+
+
+# 多模态 content block 的类型分发表：一次 dict 查找取代逐项的
+# if/elif 字符串比较链；None 表示显式忽略该类型
+_PART_HANDLERS: dict[str, Any] = {
+    "text": _part_text,
+    "image_url": _part_image,
+    "audio_url": _part_audio,
+    "think": None,
+}
+
+
+def _content_to_safe_text(content: Any) -> str:
+    """将 AstrBot/OpenAI 风格上下文内容安全转为文本。"""
+    # 1) 纯文本——最常见的情况。短字符串直接返回，
+    # 省掉一次 _truncate_text 函数调用；前缀判断用单次 startswith(tuple)
+    if isinstance(content, str):
+        if content.startswith(("base64://", "data:image")):
+            return "[图片]"
+        if len(content) <= 2000:
+            return content
+        return content[:2000] + "...(truncated)"
+
+    # 2) OpenAI 多模态 content blocks：按 type 走分发表
+    if isinstance(content, list):
+        parts: list[str] = []
+        for item in content:
+            if not isinstance(item, dict):
+                continue
+
+            item_type = item.get("type")
+            if isinstance(item_type, str):
+                handler = _PART_HANDLERS.get(item_type, _part_fallback)
+                if handler is None:
+                    # 显式忽略的类型（如 think）
+                    continue
+            else:
+                # type 缺失或非字符串，交给兜底逻辑按关键字段识别
+                handler = _part_fallback
+
+            part = handler(item)
+            if part:
+                parts.append(part)
+
+        merged = " ".join(parts)
+        return merged or ""
+
+    # 3) 其他结构：避免展开潜在大对象
+    if isinstance(content, dict):
+        if "image_url" in content or "audio_url" in content:
+            return "[图片]" if "image_url" in content else "[音频]"
+        text = content.get("text")
+        if isinstance(text, str):
+            return _truncate_text(text)
+        return ""
+
+    return ""
 
 
 def format_context_to_string(
@@ -193,62 +347,6 @@ def format_context_to_string(
     if length <= 0 or not context_history:
         return ""
 
-    def _truncate_text(text: str, max_chars: int = 2000) -> str:
-        if len(text) <= max_chars:
-            return text
-        return text[:max_chars] + "...(truncated)"
-
-    def _content_to_safe_text(content: Any) -> str:
-        """将 AstrBot/OpenAI 风格上下文内容安全转为文本。"""
-        # 1) 纯文本
-        if isinstance(content, str):
-            if content.startswith("base64://") or content.startswith("data:image"):
-                return "[图片]"
-            return _truncate_text(content)
-
-        # 2) OpenAI 多模态 content blocks
-        if isinstance(content, list):
-            parts: list[str] = []
-            for item in content:
-                if not isinstance(item, dict):
-                    continue
-
-                item_type = item.get("type")
-
-                if item_type == "text":
-                    text = item.get("text")
-                    if isinstance(text, str) and text.strip():
-                        parts.append(_truncate_text(text))
-                    continue
-
-                if item_type == "image_url" or "image_url" in item:
-                    parts.append("[图片]")
-                    continue
-
-                if item_type == "audio_url" or "audio_url" in item:
-                    parts.append("[音频]")
-                    continue
-
-                if item_type == "think":
-                    continue
-
-                if isinstance(item_type, str) and item_type:
-                    parts.append(f"[{item_type}]")
-
-            merged = " ".join(p for p in parts if p)
-            return merged or ""
-
-        # 3) 其他结构：避免展开潜在大对象
-        if isinstance(content, dict):
-            if "image_url" in content or "audio_url" in content:
-                return "[图片]" if "image_url" in content else "[音频]"
-            text = content.get("text")
-            if isinstance(text, str):
-                return _truncate_text(text)
-            return ""
-
-        return ""
-
     selected_contents: list[str] = []
     count = 0
 
@@ -265,12 +363,14 @@ def format_context_to_string(
             # 1. 尝试获取发送者名称 (Multi-User Attribution)
             sender_name = message.get("name")
             
-            raw_role = message.get("role", "").lower()
+            # intern 归一化后的角色串：后续 frozenset 成员测试和 == 比较
+            # 可命中指针相等的快速路径（lower() 每次都产生新串）
+            raw_role = sys.intern(message.get("role", "").lower())
             # 明确映射角色名称，避免混淆
-            if raw_role in ["user", "human"]:
+            if raw_role in _ROLE_USER_KEYS:
                 # 如果有具体名字，优先使用名字
                 role = sender_name if sender_name else "User"
-            elif raw_role in ["assistant", "model", "ai"]:
+            elif raw_role in _ROLE_AI_KEYS:
                 role = "Rosa"
             elif raw_role == "system":
                 continue # 跳过系统提示，专注于对话历史
@@ -281,7 +381,11 @@ def format_context_to_string(
             content = _content_to_safe_text(content_obj)
             
             # 尝试获取时间戳
-            ts = message.get("timestamp") or message.get("created_at") or message.get("time")
+            ts = None
+            for ts_key in _TS_KEYS:
+                ts = message.get(ts_key)
+                if ts:
+                    break
             if ts:
                 # 简单格式化，假设是字符串或时间戳对象
                 timestamp_str = f"[{ts}] "
@@ -291,7 +395,7 @@ def format_context_to_string(
 
         elif hasattr(message, "role") and hasattr(message, "content"):
              # 处理对象类型的消息 (如 AstrBot 的 MessageSegment)
-            raw_role = getattr(message, "role", "").lower()
+            raw_role = sys.intern(getattr(message, "role", "").lower())
             
             # 尝试从对象属性中获取 name
             sender_name = getattr(message, "name", None)
@@ -307,11 +411,13 @@ def format_context_to_string(
 
         if content:
             # 构建单条结构化消息: [Time] Role: Content
+            # 倒序遍历时 append 到尾部（O(1)），输出前整体反转一次；
+            # insert(0, ...) 每次都要搬移整个列表，消息多时退化为 O(n²)
             msg_line = f"{timestamp_str}{role}: {content}"
-            selected_contents.insert(0, msg_line)
+            selected_contents.append(msg_line)
             count += 1
 
-    return "\n".join(selected_contents)
+    return "\n".join(reversed(selected_contents))
 
 
 def is_group_chat(event: AstrMessageEvent) -> bool:
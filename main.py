@@ -58,6 +58,7 @@ class Mnemosyne(Star):
         self.collection_name: str = DEFAULT_COLLECTION_NAME
         self.milvus_manager: MilvusManager | None = None
         self.milvus_adapter: Any = None  # MilvusVectorDB 适配器（可选）
+        self._query_coalescer: Any = None  # MilvusQueryCoalescer（按需惰性创建）
         self.msg_counter: MessageCounter | None = None
         self.context_manager: ConversationContextManager | None = None
         self.embedding_provider: EmbeddingProvider | None = None
@@ -65,6 +66,7 @@ class Mnemosyne(Star):
         self.admin_panel_server: AdminPanelServer | None = None  # 管理面板服务器
         self.admin_panel_thread = None  # 管理面板服务器线程
         self.plugin_data_dir: str | None = None  # 插件数据目录
+        self._backup_dir: Any = None  # 备份目录 Path（首次 mkdir 成功后缓存）
 
         # --- 初始化状态标记 ---
         self._initialization_successful = False
@@ -1,48 +1,73 @@
-import threading
 import time
+from collections.abc import Sequence
 
 from astrbot.api.event import AstrMessageEvent
 
+# get_history 已废弃且恒为空；共享的不可变空元组避免每次调用分配新 list
+_EMPTY_HISTORY: tuple[dict, ...] = ()
+
+
+class SessionEventRef:
+    """
+    会话事件的轻量快照。
+
+    总结流程只需要事件的少量标识字段；长期持有整个
+    AstrMessageEvent 会连带保留消息负载（文本/图片段等），
+    导致每个会话的首条消息永远无法被 GC 回收。
+    """
+
+    __slots__ = ("unified_msg_origin", "group_id", "platform_name", "bot")
+
+    def __init__(self, event: AstrMessageEvent):
+        self.unified_msg_origin = getattr(event, "unified_msg_origin", None)
+        try:
+            self.group_id = event.get_group_id()
+        except Exception:
+            self.group_id = ""
+        try:
+            self.platform_name = event.get_platform_name()
+        except Exception:
+            self.platform_name = ""
+        self.bot = getattr(event, "bot", None)
+
 
 class ConversationContextManager:
     """
     会话上下文管理器
 
-    M18 修复: 改进并发安全性
-    - 在异步环境中，如果所有操作都在同一个事件循环线程中执行，threading.RLock 是安全的
-    - 保留 RLock 用于同步代码路径
-    - 添加注释说明并发安全策略
+    并发安全策略: 本类的方法只在 asyncio 事件循环线程中调用，
+    且每个方法内部只做简单的 dict 读写——在 GIL 下这些操作本身就是
+    原子的，因此不持有锁（此前的 threading.RLock 在这条每轮 LLM
+    调用都会经过的路径上是纯开销）。如果未来引入跨线程访问或
+    "检查后更新"的复合操作，应改用 asyncio.Lock。
     """
 
     def __init__(self):
         self.conversations: dict[str, dict] = {}
-        # 使用 RLock 保证线程安全
-        # 注意: 这个类的方法主要在 asyncio 事件循环中调用
-        # RLock 可以保护同步代码路径，对于异步代码，Python 的 GIL 和单线程事件循环提供了基本保护
-        # 如果未来需要真正的异步锁，应该使用 asyncio.Lock
-        self._lock = threading.RLock()
+
+    @staticmethod
+    def _new_session(last_summary_time: int, event_ref: SessionEventRef | None = None) -> dict:
+        """构造统一 schema 的会话条目（init_conv 与 add_message 共用）。"""
+        return {"last_summary_time": last_summary_time, "event": event_ref}
 
     def init_conv(self, session_id: str, contexts: list[dict], event: AstrMessageEvent):
         """
         初始化会话上下文 (仅存储元数据)
         """
-        with self._lock:
-            if session_id in self.conversations:
-                return
-            self.conversations[session_id] = {}
-            # [Optimization] 移除内存历史记录
-            # self.conversations[session_id]["history"] = contexts
-            self.conversations[session_id]["event"] = event
-            # 初始化最后一次总结的时间（对齐 OneBot/NapCat 的秒级时间戳）
-            last_summary_time = 0
-            try:
-                last_summary_time = int(event.message_obj.timestamp) - 1
-            except Exception:
-                last_summary_time = int(time.time()) - 1
-            if last_summary_time < 0:
-                last_summary_time = 0
-            self.conversations[session_id]["last_summary_time"] = last_summary_time
+        if session_id in self.conversations:
             return
+        # [Optimization] 不保留完整事件对象，只存总结流程需要的轻量快照
+        # 初始化最后一次总结的时间（对齐 OneBot/NapCat 的秒级时间戳）
+        try:
+            last_summary_time = int(event.message_obj.timestamp) - 1
+        except Exception:
+            last_summary_time = int(time.time()) - 1
+        if last_summary_time < 0:
+            last_summary_time = 0
+        self.conversations[session_id] = self._new_session(
+            last_summary_time, SessionEventRef(event)
+        )
+        return
 
     def add_message(self, session_id: str, role: str, content: str) -> str | None:
         """
@@ -52,63 +77,51 @@ class ConversationContextManager:
         :param content: 对话内容
         :return: None
         """
-        with self._lock:
-            if session_id not in self.conversations:
-                self.conversations[session_id] = {
-                    # "history": [], # [Optimization] 移除
-                    "last_summary_time": int(time.time()),
-                }
-            
-            # [Optimization] 不再追加历史记录
-            # conversation = self.conversations[session_id]
-            # conversation["history"].append(...)
-            pass
+        if session_id not in self.conversations:
+            self.conversations[session_id] = self._new_session(int(time.time()))
+
+        # [Optimization] 不再追加历史记录
+        # conversation = self.conversations[session_id]
+        # conversation["history"].append(...)
+        pass
 
     def get_summary_time(self, session_id: str) -> float:
         """
         获取最后一次总结时间
         """
-        with self._lock:
-            if session_id in self.conversations:
-                return self.conversations[session_id]["last_summary_time"]
-            else:
-                return 0
+        if session_id in self.conversations:
+            return self.conversations[session_id]["last_summary_time"]
+        else:
+            return 0
 
     def update_summary_time(self, session_id: str, summary_time: int | float | None = None):
         """
         更新最后一次总结时间
         """
-        with self._lock:
-            if session_id in self.conversations:
-                if summary_time is None:
-                    summary_time = int(time.time())
-                try:
-                    summary_time_int = int(summary_time)
-                except (TypeError, ValueError):
-                    summary_time_int = int(time.time())
-                if summary_time_int < 0:
-                    summary_time_int = 0
-                self.conversations[session_id]["last_summary_time"] = summary_time_int
-
-    def get_history(self, session_id: str) -> list[dict]:
+        if session_id in self.conversations:
+            if summary_time is None:
+                summary_time = int(time.time())
+            try:
+                summary_time_int = int(summary_time)
+            except (TypeError, ValueError):
+                summary_time_int = int(time.time())
+            if summary_time_int < 0:
+                summary_time_int = 0
+            self.conversations[session_id]["last_summary_time"] = summary_time_int
+
+    def get_history(self, session_id: str) -> Sequence[dict]:
         """
-        获取对话历史记录 (已废弃，始终返回空列表)
+        获取对话历史记录 (已废弃，始终返回空序列)
         :param session_id: 会话ID
-        :return: 空列表
+        :return: 空序列（共享的不可变元组，调用方不应修改）
         """
-        return []
-        # with self._lock:
-        #     if session_id in self.conversations:
-        #         return self.conversations[session_id]["history"]
-        #     else:
-        #         return []
+        return _EMPTY_HISTORY
 
     def get_session_context(self, session_id: str):
         """
         获取session_id对应的所有信息
         """
-        with self._lock:
-            if session_id in self.conversations:
-                return self.conversations[session_id]
-            else:
-                return {}
+        if session_id in self.conversations:
+            return self.conversations[session_id]
+        else:
+            return {}
@@ -20,6 +20,7 @@
 # 导入依赖
 from .milvus_adapter import MilvusVectorDB
 from .milvus_manager import MilvusManager
+from .query_coalescer import MilvusQueryCoalescer
 from .schema_utils import (
     collection_schema_to_dict,
     dict_to_collection_schema,
@@ -56,6 +57,8 @@ __all__ = [
     "validate_schema_dict",
     # 底层管理器
     "MilvusManager",
+    # 查询合并器
+    "MilvusQueryCoalescer",
     # 旧实现（已废弃，使用虚拟实现保持向后兼容）
     "MilvusDatabase",
 ]
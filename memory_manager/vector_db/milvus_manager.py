@@ -6,6 +6,7 @@ from pathlib import Path
 from typing import Any
 from urllib.parse import urlparse
 
+import numpy as np
 from pymilvus import Collection, CollectionSchema, DataType, connections, utility
 from pymilvus.exceptions import (
     CollectionNotExistException,
@@ -122,6 +123,11 @@ class MilvusManager:
         self._last_connection_check = 0  # 上次连接检查时间戳
         self._connection_check_interval = 30  # 连接检查间隔（秒）
         self._cached_connection_status = False  # 缓存的连接状态
+        # 集合列表缓存：list_collections / has_collection 是幂等 RPC，
+        # 结果只在显式建/删集合时变化，短 TTL 缓存可避免每条命令重复往返
+        self._collections_cache: list[str] | None = None
+        self._collections_cache_time = 0  # 集合列表缓存时间戳
+        self._collections_cache_ttl = 10  # 集合列表缓存有效期（秒）
 
         # 3. 确定连接模式并配置参数
         self._configure_connection_mode()
@@ -535,8 +541,21 @@ class MilvusManager:
             )
 
     # --- Collection Management ---
+    def _invalidate_collections_cache(self):
+        """使集合列表缓存失效（建/删集合后调用）。"""
+        self._collections_cache = None
+        self._collections_cache_time = 0
+
     def has_collection(self, collection_name: str) -> bool:
-        """检查指定的集合是否存在。"""
+        """检查指定的集合是否存在。优先命中集合列表缓存，未命中再发起 RPC。"""
+        if (
+            self._collections_cache is not None
+            and time.time() - self._collections_cache_time
+            < self._collections_cache_ttl
+            and collection_name in self._collections_cache
+        ):
+            # 注意：缓存中"不存在"不能直接判否，其他客户端可能刚创建了集合
+            return True
         self._ensure_connected()
         try:
             return utility.has_collection(collection_name, using=self.alias)
@@ -575,6 +594,7 @@ class MilvusManager:
             # 显式调用 utility.flush([collection_name]) 可能有助于确保集合元数据更新
             # utility.flush([collection_name], using=self.alias)
             logger.info(f"成功发送创建集合 '{collection_name}' 的请求。")
+            self._invalidate_collections_cache()
             return collection
         except MilvusException as e:
             logger.error(f"创建集合 '{collection_name}' 失败: {e}")
@@ -602,16 +622,26 @@ class MilvusManager:
         try:
             utility.drop_collection(collection_name, timeout=timeout, using=self.alias)
             logger.info(f"成功删除集合 '{collection_name}'。")
+            self._invalidate_collections_cache()
             return True
         except MilvusException as e:
             logger.error(f"删除集合 '{collection_name}' 失败: {e}")
             return False
 
     def list_collections(self) -> list[str]:
-        """列出 Milvus 实例中的所有集合。"""
+        """列出 Milvus 实例中的所有集合。结果带短 TTL 缓存以减少重复 RPC。"""
+        now = time.time()
+        if (
+            self._collections_cache is not None
+            and now - self._collections_cache_time < self._collections_cache_ttl
+        ):
+            return self._collections_cache
         self._ensure_connected()
         try:
-            return utility.list_collections(using=self.alias)
+            collections = utility.list_collections(using=self.alias)
+            self._collections_cache = collections
+            self._collections_cache_time = now
+            return collections
         except MilvusException as e:
             logger.error(f"列出集合失败: {e}")
             return []
@@ -705,6 +735,32 @@ class MilvusManager:
             return {"error": f"Unexpected error: {str(e)}"}
 
     # --- Data Operations ---
+    @staticmethod
+    def _quantize_fp16_vectors(collection: Collection, data: list[list | dict]):
+        """
+        对 schema 中声明为 FLOAT16_VECTOR 的字段在客户端完成 FP16 量化。
+        网络传输字节数和服务端索引内存减半；字段为 FLOAT_VECTOR 时不做任何转换。
+        """
+        fp16_fields = [
+            field.name
+            for field in collection.schema.fields
+            if field.dtype == DataType.FLOAT16_VECTOR
+        ]
+        if not fp16_fields:
+            return
+        for item in data:
+            if not isinstance(item, dict):
+                continue
+            for field_name in fp16_fields:
+                value = item.get(field_name)
+                if value is None:
+                    continue
+                if isinstance(value, np.ndarray):
+                    if value.dtype != np.float16:
+                        item[field_name] = value.astype(np.float16)
+                else:
+                    item[field_name] = np.asarray(value, dtype=np.float16)
+
     def insert(
         self,
         collection_name: str,
@@ -762,6 +818,9 @@ class MilvusManager:
                         # else: 用户提供的时间戳有效，保留不变
                 # Add more checks if needed (e.g., for List[List])
 
+            # FLOAT16_VECTOR 字段在发送前量化为 FP16（上线半精度集合时生效）
+            self._quantize_fp16_vectors(collection, data)
+
             mutation_result = collection.insert(
                 data=data, partition_name=partition_name, timeout=timeout, **kwargs
             )
@@ -1235,6 +1294,16 @@ class MilvusManager:
         logger.info(
             f"在集合 '{collection_name}' 中搜索 {len(query_vectors)} 个向量 (字段: {vector_field}, top_k: {limit})..."
         )
+        # 目标字段为 FLOAT16_VECTOR 时，查询向量同样需要量化为 FP16
+        for field in collection.schema.fields:
+            if field.name == vector_field and field.dtype == DataType.FLOAT16_VECTOR:
+                query_vectors = [
+                    vector.astype(np.float16)
+                    if isinstance(vector, np.ndarray)
+                    else np.asarray(vector, dtype=np.float16)
+                    for vector in query_vectors
+                ]
+                break
         try:
             # 确保 output_fields 包含主键字段，以便后续能获取 ID
             if collection.schema.primary_field:
@@ -1459,6 +1528,81 @@ class MilvusManager:
             logger.error(f"在集合 '{collection_name}' 中执行查询时发生意外错误: {e}")
             return None
 
+    def query_iterator(
+        self,
+        collection_name: str,
+        expression: str = "",
+        output_fields: list[str] | None = None,
+        batch_size: int = 1000,
+        limit: int = -1,
+        timeout: float | None = None,
+        **kwargs,
+    ):
+        """
+        创建一个按批次拉取实体的查询迭代器，避免一次性物化全量结果。
+        Args:
+            collection_name (str): 目标集合名称。
+            expression (str): 过滤条件表达式，空字符串表示不过滤（全量扫描）。
+            output_fields (Optional[List[str]]): 要返回的字段列表。
+            batch_size (int): 每次从服务端拉取的实体数。
+            limit (int): 返回的最大实体总数，-1 表示不限制。
+            timeout (Optional[float]): 操作超时时间。
+            **kwargs: 传递给 collection.query_iterator 的其他参数。
+        Returns:
+            Optional[QueryIterator]: 迭代器对象（通过 .next() 逐批获取，.close() 关闭），
+            如果创建失败（例如部署不支持迭代器）则返回 None，调用方应回退到分页 query。
+        """
+        collection = self.get_collection(collection_name)
+        if not collection:
+            logger.error(f"无法获取集合 '{collection_name}' 以创建查询迭代器。")
+            return None
+
+        # 确保连接
+        self._ensure_connected()
+
+        logger.info(
+            f"在集合 '{collection_name}' 上创建查询迭代器: '{expression}' (Batch: {batch_size}, Limit: {limit})..."
+        )
+        try:
+            return collection.query_iterator(
+                batch_size=batch_size,
+                limit=limit,
+                expr=expression,
+                output_fields=output_fields,
+                timeout=timeout,
+                **kwargs,
+            )
+        except MilvusException as e:
+            # 检查是否是因为集合未加载的错误 (code 101)
+            error_code = getattr(e, "code", None)
+            if error_code == 101:
+                logger.warning(
+                    f"集合 '{collection_name}' 未加载，尝试加载后重试... (错误: {e})"
+                )
+                if self.load_collection(collection_name, timeout=timeout):
+                    try:
+                        return collection.query_iterator(
+                            batch_size=batch_size,
+                            limit=limit,
+                            expr=expression,
+                            output_fields=output_fields,
+                            timeout=timeout,
+                            **kwargs,
+                        )
+                    except MilvusException as retry_e:
+                        logger.error(f"重试创建查询迭代器仍失败: {retry_e}")
+                        return None
+                else:
+                    logger.error(f"加载集合 '{collection_name}' 失败。")
+                    return None
+            logger.error(
+                f"在集合 '{collection_name}' 上创建查询迭代器失败 (错误代码: {error_code}): {e}"
+            )
+            return None
+        except Exception as e:
+            logger.error(f"在集合 '{collection_name}' 上创建查询迭代器时发生意外错误: {e}")
+            return None
+
     # --- Context Manager Support ---
     def __enter__(self):
         """支持 with 语句，进入时确保连接。"""
@@ -0,0 +1,204 @@
+"""
+Milvus 查询合并器
+将短时间窗口内到达的等值过滤查询合并为一次 Milvus RPC
+"""
+
+import asyncio
+
+from astrbot.core.log import LogManager
+
+from ...core.security_utils import build_eq_expr
+
+logger = LogManager.GetLogger(log_name="Mnemosyne")
+
+# Milvus 单次 query 的结果窗口上限（offset + limit）
+_MILVUS_MAX_QUERY_WINDOW = 16384
+
+
+class MilvusQueryCoalescer:
+    """
+    等值过滤查询的异步合并器。
+
+    聊天场景下多个用户几乎同时触发 list_records 等命令时，每个命令原本
+    都会发起一次独立的 Milvus query RPC。合并器把一个小窗口（默认 50ms）
+    内 (collection, field, output_fields, limit) 相同的请求改写为一个
+    `field in [...]` 查询，执行一次 RPC 后按字段值把结果行分发回各自的
+    future。窗口内只有一个请求时退化为普通等值查询，无额外往返。
+
+    查询经 asyncio.to_thread 执行，不会阻塞事件循环。本类只能在单个
+    asyncio 事件循环中使用（与插件其余部分一致）。
+    """
+
+    def __init__(
+        self,
+        milvus_manager,
+        window_seconds: float = 0.05,
+        max_batch: int = 16,
+    ):
+        """
+        Args:
+            milvus_manager: MilvusManager 实例，提供同步 query 方法。
+            window_seconds (float): 合并窗口时长（秒）。
+            max_batch (int): 单个桶内的最大请求数，达到后立即冲刷。
+        """
+        self._manager = milvus_manager
+        self._window_seconds = window_seconds
+        self._max_batch = max_batch
+        # key -> [(value, future), ...]
+        self._pending: dict[tuple, list[tuple[str, asyncio.Future]]] = {}
+        self._flush_task: asyncio.Task | None = None
+        # 事件循环只持有 Task 的弱引用：满桶冲刷这类“发射后不管”的
+        # 任务必须自己保存强引用，否则可能在执行途中被 GC 回收
+        self._inflight_tasks: set[asyncio.Task] = set()
+
+    async def query_eq(
+        self,
+        collection_name: str,
+        field: str,
+        value: str,
+        output_fields: list[str],
+        limit: int,
+    ) -> list[dict] | None:
+        """
+        提交一个 `field == value` 查询，等待合并执行后返回属于该值的记录。
+
+        Args:
+            collection_name: 目标集合名称。
+            field: 过滤字段名（必须在安全白名单中）。
+            value: 字段值（调用方必须先完成校验）。
+            output_fields: 要返回的字段列表。
+            limit: 单个请求期望的最大记录数。
+
+        Returns:
+            Optional[List[Dict]]: 匹配记录，底层查询失败时为 None。
+        """
+        key = (collection_name, field, tuple(output_fields), limit)
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        bucket = self._pending.setdefault(key, [])
+        bucket.append((value, future))
+
+        if len(bucket) >= self._max_batch:
+            # 桶已满，立即冲刷，不再等待窗口结束
+            pending = self._pending.pop(key, None)
+            if pending:
+                task = asyncio.create_task(self._execute(key, pending))
+                self._inflight_tasks.add(task)
+                task.add_done_callback(self._inflight_tasks.discard)
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+        return await future
+
+    async def _delayed_flush(self):
+        """等待合并窗口结束后冲刷所有待处理的桶。"""
+        await asyncio.sleep(self._window_seconds)
+        # 必须循环清空：在 await _execute 执行 RPC 期间到达的新请求会
+        # 入队 _pending，但因为本任务尚未 done()，query_eq 不会再调度
+        # 新的冲刷任务——若此处只冲刷一次快照，这些请求会永远挂起
+        while self._pending:
+            for key in list(self._pending):
+                bucket = self._pending.pop(key, None)
+                if bucket:
+                    await self._execute(key, bucket)
+
+    async def _execute(
+        self, key: tuple, bucket: list[tuple[str, asyncio.Future]]
+    ):
+        """执行一个桶的合并查询并将结果按字段值demux回各 future。"""
+        collection_name, field, output_fields, limit = key
+        # 去重并保持提交顺序
+        values = list(dict.fromkeys(value for value, _ in bucket))
+
+        # 合并后的查询需要能覆盖每个请求各自的 limit。超出 Milvus 单次
+        # 查询窗口时不能简单截断：记录多的值会挤占窗口、让其他值拿到
+        # 比独立查询更少的行。这种情况放弃合并，逐值并发查询，
+        # 保证结果与未合并时完全一致
+        combined_limit = limit * len(values)
+        if len(values) > 1 and combined_limit > _MILVUS_MAX_QUERY_WINDOW:
+            await self._execute_per_value(key, bucket, values)
+            return
+
+        try:
+            if len(values) == 1:
+                expression = build_eq_expr(field, values[0])
+            else:
+                quoted = ", ".join(f'"{value}"' for value in values)
+                expression = f"{field} in [{quoted}]"
+        except ValueError as e:
+            for _, future in bucket:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        # demux 需要过滤字段本身出现在结果中
+        query_fields = list(output_fields)
+        if field not in query_fields and "*" not in query_fields:
+            query_fields.append(field)
+
+        logger.debug(
+            f"合并执行 {len(bucket)} 个等值查询 (集合: {collection_name}, "
+            f"字段: {field}, 值数量: {len(values)})"
+        )
+
+        try:
+            records = await asyncio.to_thread(
+                self._manager.query,
+                collection_name=collection_name,
+                expression=expression,
+                output_fields=query_fields,
+                limit=combined_limit,
+            )
+        except Exception as e:
+            logger.error(f"合并查询执行失败: {e}")
+            for _, future in bucket:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        if records is None:
+            for _, future in bucket:
+                if not future.done():
+                    future.set_result(None)
+            return
+
+        grouped: dict[str, list[dict]] = {}
+        for record in records:
+            grouped.setdefault(record.get(field), []).append(record)
+
+        for value, future in bucket:
+            if not future.done():
+                future.set_result(grouped.get(value, []))
+
+    async def _execute_per_value(
+        self, key: tuple, bucket: list[tuple[str, asyncio.Future]], values: list[str]
+    ):
+        """逐值并发执行等值查询（合并窗口不足以覆盖各请求 limit 时的回退）。"""
+        collection_name, field, output_fields, limit = key
+
+        logger.debug(
+            f"合并窗口不足，回退为 {len(values)} 个并发等值查询 "
+            f"(集合: {collection_name}, 字段: {field}, limit: {limit})"
+        )
+
+        async def _query_one(value: str):
+            expression = build_eq_expr(field, value)
+            return await asyncio.to_thread(
+                self._manager.query,
+                collection_name=collection_name,
+                expression=expression,
+                output_fields=list(output_fields),
+                limit=limit,
+            )
+
+        results = await asyncio.gather(
+            *(_query_one(value) for value in values), return_exceptions=True
+        )
+        result_by_value = dict(zip(values, results))
+
+        for value, future in bucket:
+            if future.done():
+                continue
+            result = result_by_value[value]
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)